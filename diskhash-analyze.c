@@ -22,18 +22,29 @@ public:
     unsigned char *buffer;
     size_t num_elements;
     unsigned int hash_size;
+    unsigned int element_size;  // hash followed by run length for RLE files
     unsigned char *temp;
 
     inline unsigned char* hash_ptr(size_t i)
     {
-        return &this->buffer[i * this->hash_size];
+        return &this->buffer[i * this->element_size];
+    }
+
+    // number of sectors the element stands for
+    inline size_t count(size_t i)
+    {
+        if(this->element_size == this->hash_size) {
+            return 1;
+        }
+        unsigned char *p = this->hash_ptr(i) + this->hash_size;
+        return (size_t) p[0] | ((size_t) p[1] << 8) | ((size_t) p[2] << 16) | ((size_t) p[3] << 24);
     }
 
     void swap(size_t i, size_t j)
     {
-        memcpy(this->temp, this->hash_ptr(i), this->hash_size);
-        memcpy(this->hash_ptr(i), this->hash_ptr(j), this->hash_size);
-        memcpy(this->hash_ptr(j), this->temp, this->hash_size);
+        memcpy(this->temp, this->hash_ptr(i), this->element_size);
+        memcpy(this->hash_ptr(i), this->hash_ptr(j), this->element_size);
+        memcpy(this->hash_ptr(j), this->temp, this->element_size);
     }
 
     bool is_below(size_t i, size_t j)
@@ -68,17 +79,18 @@ public:
         }
     }
 
-    HashArray(unsigned char* buffer, size_t num_elements, unsigned int hash_size)
+    HashArray(unsigned char* buffer, size_t num_elements, unsigned int hash_size, unsigned int element_size)
     {
-        this->temp = new unsigned char(hash_size);
+        this->temp = new unsigned char[element_size];
         this->buffer = buffer;
         this->num_elements = num_elements;
         this->hash_size = hash_size;
+        this->element_size = element_size;
     }
 
     ~HashArray()
     {
-        delete this->temp;
+        delete[] this->temp;
     }
 
     size_t get_num_elements()
@@ -127,7 +139,7 @@ public:
         }
     }
 
-    inline void increase(unsigned char* hash_ptr)
+    inline void increase(unsigned char* hash_ptr, size_t n = 1)
     {
         // find existing hash
         unsigned char *duplicate_hash = NULL;
@@ -145,7 +157,7 @@ public:
         }
 
         if(duplicate_hash != NULL) {
-            this->counts[duplicate_index]++;
+            this->counts[duplicate_index] += n;
             return;
         }
 
@@ -160,7 +172,7 @@ public:
             }
         }
         memcpy(this->hashes + this->num_items * this->hash_size, hash_ptr, this->hash_size);
-        this->counts[this->num_items] = 1;
+        this->counts[this->num_items] = n;
         this->num_items++;
     }
 
@@ -181,18 +193,43 @@ public:
     }
 };
 
+// secha.py hash file header, see secha.py for the layout
+static const char secha_magic[8] = {'P', 'D', 'T', 'S', 'E', 'C', 'H', 'A'};
+static const unsigned int secha_header_prefix_size = 154;
+static const unsigned int secha_flag_rle = 1;
+
+inline unsigned int read_le16(unsigned char* ptr)
+{
+    return ptr[0] | (ptr[1] << 8);
+}
+
+inline size_t read_le64(unsigned char* ptr)
+{
+    size_t v = 0;
+    for(int i = 7; i >= 0; i--) {
+        v = (v << 8) | ptr[i];
+    }
+    return v;
+}
+
 int main(int argc, char* argv[])
 {
     char* filename;
-    unsigned int hash_size;
-
-    if(argc != 3) {
-        fprintf(stderr, "Arguments required: <file name> <hash size>\n");
+    unsigned int hash_size = 0;
+    unsigned int element_size;
+    size_t data_offset = 0;
+    size_t data_size = 0;
+
+    if(argc != 2 && argc != 3) {
+        fprintf(stderr, "Arguments required: <file name> [hash size]\n");
+        fprintf(stderr, "Hash size is taken from the header, or defaults to 8 for legacy files\n");
         return 1;
     }
 
     filename = argv[1];
-    sscanf(argv[2], "%u", &hash_size);
+    if(argc == 3) {
+        sscanf(argv[2], "%u", &hash_size);
+    }
 
     fprintf(stderr, "Opening file...\n");
     FILE *fp;
@@ -204,11 +241,42 @@ int main(int argc, char* argv[])
         return 1;
     }
 
+    unsigned char header[secha_header_prefix_size];
+    if(fread(header, 1, secha_header_prefix_size, fp) == secha_header_prefix_size
+       && memcmp(header, secha_magic, sizeof(secha_magic)) == 0) {
+        unsigned int version = read_le16(header + 8);
+        if(version != 1 && version != 2) {
+            fprintf(stderr, "Unsupported hash file version %u\n", version);
+            return 1;
+        }
+        unsigned int header_hash_size = read_le16(header + 28);
+        if(hash_size != 0 && hash_size != header_hash_size) {
+            fprintf(stderr, "Hash size %u does not match hash file hash size %u\n", hash_size, header_hash_size);
+            return 1;
+        }
+        hash_size = header_hash_size;
+        data_offset = read_le16(header + 10);
+        if(read_le16(header + 130) & secha_flag_rle) {
+            // runs: hash followed by 4-byte run length, index is not needed here
+            element_size = hash_size + 4;
+            data_size = read_le64(header + 146) * element_size;
+        }
+    } else if(hash_size == 0) {
+        // legacy file
+        hash_size = 8;
+    }
+    if(data_size == 0) {
+        element_size = hash_size;
+    }
+
     fseek(fp, 0, SEEK_END);
-    file_size = ftell(fp);
-    rewind(fp);
+    file_size = ftell(fp) - data_offset;
+    fseek(fp, data_offset, SEEK_SET);
+    if(data_size != 0) {
+        file_size = data_size;
+    }
 
-    if(file_size % hash_size != 0) {
+    if(file_size % element_size != 0) {
         fprintf(stderr, "File size is not multiple of hash size\n");
         return 1;
     }
@@ -231,10 +299,10 @@ int main(int argc, char* argv[])
         size_read += n;
     }
     fclose(fp);
-    fprintf(stderr, "Read %zu elements %u bytes each\n", file_size / hash_size, hash_size);
+    fprintf(stderr, "Read %zu elements %u bytes each\n", file_size / element_size, element_size);
 
     fprintf(stderr, "Sorting hashes...\n");
-    HashArray hash_array = HashArray(buffer, file_size / hash_size, hash_size);
+    HashArray hash_array = HashArray(buffer, file_size / element_size, hash_size, element_size);
     hash_array.sort();
     /*
     for(size_t i = 0; i < hash_array.get_num_elements(); i++) {
@@ -245,14 +313,19 @@ int main(int argc, char* argv[])
 
     fprintf(stderr, "Finding collisions...\n");
     HashCount duplicate_hashes = HashCount(hash_size);
-    unsigned char *prev_hash_ptr = hash_array.hash_ptr(0);
-    for(size_t i = 1, j = hash_array.get_num_elements(); i < j; i++) {
+    unsigned char *prev_hash_ptr = NULL;
+    for(size_t i = 0, j = hash_array.get_num_elements(); i < j; i++) {
         unsigned char *hash_ptr = hash_array.hash_ptr(i);
-        if(memcmp(hash_ptr, prev_hash_ptr, hash_size) == 0) {
-            duplicate_hashes.increase(hash_ptr);
+        size_t n = hash_array.count(i);
+        if(prev_hash_ptr != NULL && memcmp(hash_ptr, prev_hash_ptr, hash_size) == 0) {
+            duplicate_hashes.increase(hash_ptr, n);
             fprintf(stderr, ".");
         } else {
             prev_hash_ptr = hash_ptr;
+            // all sectors of a run but the first one are duplicates
+            if(n > 1) {
+                duplicate_hashes.increase(hash_ptr, n - 1);
+            }
         }
     }
 
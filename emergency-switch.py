@@ -22,8 +22,10 @@ min_tap_interval = 0.12
 max_tap_interval = 0.25
 
 emergency_terminal = 7
+journal_teardown_timeout = 10  # seconds
 
 import asyncio
+import os
 
 import evdev
 
@@ -89,6 +91,22 @@ async def touchpad_checker(input_device):
             await asyncio.sleep(1)
             continue
 
+async def teardown_journal():
+    '''
+    Tear down everything recorded in the journal before shutdown
+    to close encrypted volumes, but do not delay shutdown for too long.
+    '''
+    pdt_umount = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pdt_umount')
+    try:
+        proc = await asyncio.create_subprocess_exec(pdt_umount, '--all')
+    except Exception as e:
+        print(e)
+        return
+    try:
+        await asyncio.wait_for(proc.communicate(), journal_teardown_timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+
 touch_window = []
 
 async def process_touchpad_event(packet):
@@ -106,6 +124,7 @@ async def process_touchpad_event(packet):
                 if min_tap_interval < t1 and t1 < max_tap_interval and \
                    min_tap_interval < t2 and t2 < max_tap_interval:
                     print('SHUTDOWN')
+                    await teardown_journal()
                     proc = await asyncio.create_subprocess_shell('shutdown -r now')
                     await proc.communicate()
 
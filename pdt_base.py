@@ -16,6 +16,9 @@ import time
 import traceback
 from  types import SimpleNamespace
 
+import pdt_native_mount
+import pdt_proc
+
 def read_config(base_dir):
     '''
     Read `config.json` file located in `base_dir`.
@@ -64,6 +67,7 @@ def setup(config, invoke, *tasks):
             task = task_class(config, invoke, context)
             task.setup()
             sequence.append(task)
+            invoke.journal_add('task', name=task_class.__name__)
     except:
         teardown(sequence)
         raise
@@ -76,6 +80,7 @@ def teardown(sequence):
     for task in sequence[::-1]:
         try:
             task.teardown()
+            task.invoke.journal_remove('task', name=type(task).__name__)
         except:
             print(traceback.format_exc())
             raise
@@ -83,18 +88,34 @@ def teardown(sequence):
 class Invoke:
     '''
     Functions that use shell commands, either local, or remote via SSH.
+    Local file and mount operations use system calls directly unless `native` is False.
+    If `journal` is given, everything set up is recorded in it, see pdt_journal.
     '''
-    def __init__(self, remote=None, ssh_key=None):
+    def __init__(self, remote=None, ssh_key=None, native=True, journal=None):
         self.remote = remote
         self.ssh_key = ssh_key
+        self.native = native and not remote
+        self.journal = journal
+
+    def journal_add(self, kind, **data):
+        if self.journal is not None:
+            self.journal.add(kind, **data)
+
+    def journal_remove(self, kind, **match):
+        if self.journal is not None:
+            self.journal.remove(kind, **match)
+
+    def ssh_args(self):
+        args = ['ssh']
+        if self.ssh_key:
+            args.extend(['-i', self.ssh_key])
+        args.append(f'root@{self.remote}')
+        return args
 
     def run(self, command, check=True, shell=False, capture_output=True, **kwargs):
         print('>>>', command)
         if self.remote:
-            args = ['ssh']
-            if self.ssh_key:
-                args.extend(['-i', self.ssh_key])
-            args.append(f'root@{self.remote}')
+            args = self.ssh_args()
             args.extend(shlex.split(command))
             shell = False
         else:
@@ -107,6 +128,16 @@ class Invoke:
             raise Exception(f'Failed {command}: {result.stderr or result.stdout}')
         return result
 
+    def popen(self, args, title=None, **kwargs):
+        '''
+        Start a process for the list of `args` without waiting for it to complete.
+        Arguments are quoted for the remote shell.
+        '''
+        print('>>>', title or shlex.join(args))
+        if self.remote:
+            args = self.ssh_args() + [shlex.join(args)]
+        return subprocess.Popen(args, **kwargs)
+
     def set_devices(self, config):
         '''
         Devices in the configuration are identified by manufacturer serial number,
@@ -134,13 +165,104 @@ class Invoke:
                     volume_config['filename'] = device_map[tag]
 
     def path_exists(self, path):
+        if self.native:
+            return os.path.exists(path)
         result = self.run(f'[ -e {path} ]', check=False)
         return result.returncode == 0
 
     def is_dir(self, path):
+        if self.native:
+            return os.path.isdir(path)
         result = self.run(f'[ -d {path} ]', check=False)
         return result.returncode == 0
 
+    def makedirs(self, path):
+        if self.native:
+            os.makedirs(path, exist_ok=True)
+        else:
+            self.run(f'mkdir -p {path}')
+
+    def touch(self, path):
+        if self.native:
+            open(path, 'a').close()
+        else:
+            self.run(f'touch {path}')
+
+    def mount_tmpfs(self, directory, size='64K'):
+        if self.native:
+            pdt_native_mount.mount_tmpfs(directory, size)
+        else:
+            self.run(f'mount -t tmpfs -o size={size} tmpfs {directory}')
+        self.journal_add('mount', type='tmpfs', source='tmpfs', mount_point=directory)
+        return directory
+
+    def mount_bind(self, src, dest):
+        if self.native:
+            pdt_native_mount.mount_bind(src, dest)
+        else:
+            self.run(f'mount --bind {src} {dest}')
+        self.journal_add('mount', type='bind', source=src, mount_point=dest)
+        return dest
+
+    def mount_overlay(self, lower, upper, work, dest):
+        if self.native:
+            pdt_native_mount.mount_overlay(lower, upper, work, dest)
+        else:
+            self.run(f'mount -t overlay overlay -o relatime,lowerdir={lower},upperdir={upper},workdir={work} {dest}')
+        self.journal_add('mount', type='overlay', source='overlay', mount_point=dest)
+        return dest
+
+    def mount_device(self, device, directory, options=None):
+        '''
+        Mount block device. Natively, only file systems recognized by
+        pdt_native_mount.detect_fstype are mounted, others need `mount` command.
+        '''
+        fstype = self.native and pdt_native_mount.detect_fstype(device)
+        if fstype:
+            pdt_native_mount.mount_fs(fstype, directory, device, options)
+        elif options:
+            self.run(f'mount -o {",".join(options)} {device} {directory}')
+        else:
+            self.run(f'mount {device} {directory}')
+        self.journal_add('mount', type='device', source=device, mount_point=directory)
+        return directory
+
+    def umount(self, directory):
+        if self.native:
+            pdt_native_mount.umount(directory)
+        else:
+            self.run(f'umount {directory}')
+        self.journal_remove('mount', mount_point=directory)
+
+    def get_mount_points(self):
+        if self.native:
+            return pdt_proc.list_mount_points()
+        lines = self.run('cat /proc/mounts').stdout.splitlines()
+        return [pdt_proc.unescape(line.split()[1]) for line in lines]
+
+    def mount_batch(self, mounts):
+        '''
+        Perform a set of mounts given as tuples (kind, *args), where kind is
+        `tmpfs`, `bind`, `overlay` or `device`, and args are passed to
+        the corresponding mount_<kind> method.
+        If any mount fails, unmount all previous ones and re-raise.
+        Return the list of (mount_point, seconds) pairs.
+        '''
+        timings = []
+        try:
+            for kind, *args in mounts:
+                start_time = time.perf_counter()
+                mount_point = getattr(self, f'mount_{kind}')(*args)
+                timings.append((mount_point, time.perf_counter() - start_time))
+        except:
+            for mount_point, _ in timings[::-1]:
+                try:
+                    self.umount(mount_point)
+                except:
+                    print(traceback.format_exc())
+            raise
+        return timings
+
     def get_root_device(self):
         '''
         Find device for the root file system.
@@ -209,14 +331,21 @@ class Invoke:
             volume_config['sector_size']
         )
         print(f'Created loop device: {loop_device}')
+        self.journal_add('loop', device=loop_device)
         try:
-            self.run(f'cryptsetup open {loop_device} {volume_name} --type plain --key-file -', input=volume_config['key'])
+            crypt_options = ''
+            if 'crypt_sector_size' in volume_config:
+                crypt_options = f' --sector-size {volume_config["crypt_sector_size"]}'
+            self.run(f'cryptsetup open {loop_device} {volume_name} --type plain --key-file -{crypt_options}',
+                     input=volume_config['key'])
             volume_device = os.path.join('/dev/mapper', volume_name)
             print(f'Opened encrypted volume {volume_name}')
+            self.journal_add('crypt', name=volume_name, loop_device=loop_device)
             return loop_device, volume_device
         except:
             self.run(f'losetup -d {loop_device}')
             print(f'Deleted loop device: {loop_device}')
+            self.journal_remove('loop', device=loop_device)
             raise
 
     def locrypt_close(self, volume_name, loop_device):
@@ -236,8 +365,10 @@ class Invoke:
             for i in range(10):
                 if not self.is_encrypted_volume_active(volume_name):
                     print(f'Closed encrypted volume {volume_name}')
+                    self.journal_remove('crypt', name=os.path.basename(volume_name))
                     self.run(f'losetup -d {loop_device}')
                     print(f'Deleted loop device: {loop_device}')
+                    self.journal_remove('loop', device=loop_device)
                     return
                 time.sleep(0.5)
             print(f'Another attempt to close encrypted volume {volume_name}')
@@ -245,8 +376,19 @@ class Invoke:
     def locrypt_unmount(self, directory):
         '''
         Check the directory is an encrypted volume and do locrypt_close.
+        Use the journal if it has valid entries for the directory,
+        otherwise probe the system.
         '''
         directory = directory.rstrip('/')
+        if self.journal is not None:
+            mount = self.journal.find('mount', type='device', mount_point=directory)
+            if mount and mount['source'].startswith('/dev/mapper/'):
+                volume_name = os.path.basename(mount['source'])
+                crypt = self.journal.find('crypt', name=volume_name)
+                if crypt and directory in self.get_mount_points() and self.path_exists(mount['source']):
+                    self.unmount(directory)
+                    self.locrypt_close(volume_name, crypt['loop_device'])
+                    return
         lines = self.run('df').stdout.splitlines()[1:]
         for line in lines:
             device, size, used, avail, percentage, mount_point = line.strip().split()
@@ -262,15 +404,88 @@ class Invoke:
         raise Exception(f'{directory} does not look like a mounted volume')
 
     def unmount(self, directory):
-        while True:
-            self.kill_lsof_processes(directory)
-            try:
-                self.run(f'umount {directory}')
+        self.unmount_many(directory)
+
+    def replay_journal(self):
+        '''
+        Tear down everything recorded in the journal in reverse order.
+        Each entry is checked for validity; entries that no longer
+        correspond to the state of the system are dropped.
+        '''
+        # consecutive mounts are unmounted together, see unmount_many
+        pending_mounts = []
+        for entry in self.journal.entries[::-1] + [None]:
+            kind = entry['kind'] if entry else None
+            if kind == 'mount':
+                pending_mounts.append(entry['mount_point'])
+                continue
+            if pending_mounts:
+                self.unmount_many(*pending_mounts[::-1])
+                pending_mounts = []
+            if kind is None:
                 break
-            except:
-                print(f'Trying to unmount {directory}')
-                time.sleep(1)
-        print(f'Unmounted {directory}')
+            elif kind == 'crypt':
+                volume_name = entry['name']
+                if not self.path_exists(f'/dev/mapper/{volume_name}'):
+                    print(f'Not opened {volume_name}, skipping')
+                    self.journal_remove('crypt', name=volume_name)
+                    continue
+                loop_device = entry['loop_device']
+                if not self.path_exists(loop_device):
+                    loop_device = self.get_encrypted_volume_device(volume_name)
+                self.locrypt_close(volume_name, loop_device)
+            elif kind == 'loop':
+                result = self.run(f'losetup {entry["device"]}', check=False)
+                if result.returncode == 0 and result.stdout.strip():
+                    self.run(f'losetup -d {entry["device"]}')
+                    print(f'Deleted loop device: {entry["device"]}')
+                self.journal_remove('loop', device=entry['device'])
+            else:
+                self.journal.remove(**entry)
+
+    def kill_mount_holders(self, *directories, users=()):
+        '''
+        Kill processes holding files under any of `directories`
+        and processes owned by `users` in one pass.
+        '''
+        if not self.remote:
+            pdt_proc.kill_holders(mount_points=directories, users=users)
+            return
+        for username in users:
+            self.kill_user_processes(username)
+        for directory in directories:
+            self.kill_lsof_processes(directory)
+
+    def unmount_many(self, *directories):
+        '''
+        Unmount `directories` in reverse order.
+        Holders of all directories are killed in one pass, then umount is tried
+        for each of them. Only those that failed are retried, after another pass.
+        Directories that are not mounted (any more) are skipped.
+        '''
+        remaining = [os.path.normpath(directory) for directory in directories[::-1]]
+        while True:
+            mount_points = set(self.get_mount_points())
+            for directory in remaining:
+                if directory not in mount_points:
+                    print(f'Not mounted {directory}, skipping')
+                    self.journal_remove('mount', mount_point=directory)
+            remaining = [directory for directory in remaining if directory in mount_points]
+            if not remaining:
+                return
+            self.kill_mount_holders(*remaining)
+            failed = []
+            for directory in remaining:
+                try:
+                    self.umount(directory)
+                    print(f'Unmounted {directory}')
+                except:
+                    failed.append(directory)
+            if not failed:
+                return
+            print(f'Trying to unmount {" ".join(failed)}')
+            time.sleep(1)
+            remaining = failed
 
     def is_formatted(self, device):
         '''
@@ -285,6 +500,9 @@ class Invoke:
         '''
         Kill all processes owned by user.
         '''
+        if not self.remote:
+            pdt_proc.kill_holders(users=[username])
+            return
         while True:
             result = self.run(f'ps --user {username}', check=False)
             lines = result.stdout.splitlines()[1:]
@@ -298,7 +516,15 @@ class Invoke:
     def kill_lsof_processes(self, directory):
         '''
         Kill all processes that listed in lsof output for the directory.
+        Locally, this is done by native /proc scanner.
+        Directories that are not mount points are refused.
         '''
+        if os.path.normpath(directory) not in self.get_mount_points():
+            print(f'{directory} is not mounted, not killing processes')
+            return
+        if not self.remote:
+            pdt_proc.kill_holders(mount_points=[directory])
+            return
         result = self.run(f'lsof {directory}', check=False)
         lines = result.stdout.splitlines()[1:]
         pids = ' '.join(pid for _, pid in (line.strip().split(' ', 1) for line in lines))
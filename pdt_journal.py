@@ -0,0 +1,97 @@
+'''
+Plausible Deniabity Toolkit
+
+Persistent journal of everything set up: loop devices, encrypted volumes,
+mounts and tasks, in the order of setup.
+
+The journal lets teardown and recovery after a crash replay entries in reverse
+order instead of rediscovering the state of the system.
+It is kept on tmpfs, so it does not survive reboot, same as the state it describes.
+Every change is written to a temporary file, fsynced and renamed over the journal,
+so the file is always consistent. Concurrent processes (e.g. pdt_mount waiting
+for teardown and pdt_umount) serialize changes with a lock file and re-read
+the journal before each change.
+
+Copyright 2018-2022 amateur80lvl
+License: BSD, see LICENSE for details.
+'''
+
+from contextlib import contextmanager
+import fcntl
+import json
+import os
+
+default_journal_dir = '/run/pdt'
+
+class Journal:
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = self._load()
+
+    @classmethod
+    def for_host(cls, remote=None, journal_dir=default_journal_dir):
+        '''
+        Journal for the local host or for `remote`.
+        '''
+        os.makedirs(journal_dir, mode=0o700, exist_ok=True)
+        return cls(os.path.join(journal_dir, f'journal-{remote or "localhost"}.json'))
+
+    def _load(self):
+        try:
+            with open(self.filename, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def _save(self):
+        temp_filename = self.filename + '.tmp'
+        with open(temp_filename, 'w') as f:
+            json.dump(self.entries, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_filename, self.filename)
+        dir_fd = os.open(os.path.dirname(self.filename) or '.', os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    @contextmanager
+    def _locked(self):
+        with open(self.filename + '.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self.entries = self._load()
+            yield
+            self._save()
+
+    def add(self, kind, **data):
+        '''
+        Append entry of `kind` with `data`, return the entry.
+        '''
+        entry = dict(kind=kind, **data)
+        with self._locked():
+            self.entries.append(entry)
+        return entry
+
+    def remove(self, kind, **match):
+        '''
+        Remove the latest entry of `kind` matching all `match` items.
+        '''
+        with self._locked():
+            entry = self._find(kind, match)
+            if entry is not None:
+                self.entries.remove(entry)
+
+    def find(self, kind, **match):
+        '''
+        Return the latest entry of `kind` matching all `match` items, or None.
+        '''
+        self.entries = self._load()
+        return self._find(kind, match)
+
+    def _find(self, kind, match):
+        for entry in self.entries[::-1]:
+            if entry['kind'] == kind and all(entry.get(k) == v for k, v in match.items()):
+                return entry
+        return None
@@ -0,0 +1,203 @@
+'''
+Plausible Deniabity Toolkit
+
+Native mount backend: mount(2)/umount2(2) via ctypes, and the new mount API
+(fsopen/fsconfig/fsmount/open_tree/move_mount) where the kernel supports it.
+This avoids spawning `mount` and `umount` processes for local operations.
+
+Copyright 2018-2022 amateur80lvl
+License: BSD, see LICENSE for details.
+'''
+
+import ctypes
+import os
+
+libc = ctypes.CDLL(None, use_errno=True)
+libc.mount.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_ulong, ctypes.c_char_p]
+libc.umount2.argtypes = [ctypes.c_char_p, ctypes.c_int]
+libc.syscall.restype = ctypes.c_long
+
+# mount(2) flags
+MS_RDONLY      = 1
+MS_NOSUID      = 2
+MS_NODEV       = 4
+MS_NOEXEC      = 8
+MS_SYNCHRONOUS = 16
+MS_DIRSYNC     = 128
+MS_NOATIME     = 1024
+MS_NODIRATIME  = 2048
+MS_BIND        = 4096
+MS_REC         = 16384
+MS_RELATIME    = 1 << 21
+MS_STRICTATIME = 1 << 24
+MS_LAZYTIME    = 1 << 25
+
+mount_flags = {
+    'defaults':    0,
+    'rw':          0,
+    'ro':          MS_RDONLY,
+    'nosuid':      MS_NOSUID,
+    'nodev':       MS_NODEV,
+    'noexec':      MS_NOEXEC,
+    'sync':        MS_SYNCHRONOUS,
+    'dirsync':     MS_DIRSYNC,
+    'noatime':     MS_NOATIME,
+    'nodiratime':  MS_NODIRATIME,
+    'relatime':    MS_RELATIME,
+    'strictatime': MS_STRICTATIME,
+    'lazytime':    MS_LAZYTIME,
+}
+
+# New mount API. Syscall numbers are the same on all architectures except alpha.
+NR_open_tree  = 428
+NR_move_mount = 429
+NR_fsopen     = 430
+NR_fsconfig   = 431
+NR_fsmount    = 432
+
+AT_FDCWD                = -100
+AT_RECURSIVE            = 0x8000
+OPEN_TREE_CLONE         = 1
+OPEN_TREE_CLOEXEC       = os.O_CLOEXEC
+FSOPEN_CLOEXEC          = 1
+FSMOUNT_CLOEXEC         = 1
+FSCONFIG_SET_FLAG       = 0
+FSCONFIG_SET_STRING     = 1
+FSCONFIG_CMD_CREATE     = 6
+MOVE_MOUNT_F_EMPTY_PATH = 4
+
+mount_attrs = {
+    'ro':          0x01,
+    'nosuid':      0x02,
+    'nodev':       0x04,
+    'noexec':      0x08,
+    'relatime':    0x00,
+    'noatime':     0x10,
+    'strictatime': 0x20,
+    'nodiratime':  0x80,
+}
+
+def _check(result, operation, target):
+    if result < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, f'{operation} {target}: {os.strerror(err)}')
+    return result
+
+def _encode(s):
+    return None if s is None else os.fsencode(s)
+
+def parse_options(options):
+    '''
+    Split comma-separated mount `options` into mount(2) flags and data string.
+    '''
+    if isinstance(options, str):
+        options = options.split(',')
+    flags = 0
+    data = []
+    for option in options or []:
+        if option in mount_flags:
+            flags |= mount_flags[option]
+        elif option:
+            data.append(option)
+    return flags, ','.join(data) or None
+
+_new_api = None
+
+def has_new_api():
+    '''
+    Check once if the kernel supports fsopen and friends.
+    '''
+    global _new_api
+    if _new_api is None:
+        fd = libc.syscall(NR_fsopen, b'tmpfs', FSOPEN_CLOEXEC)
+        if fd >= 0:
+            os.close(fd)
+            _new_api = True
+        else:
+            _new_api = False
+    return _new_api
+
+def _fs_mount(fstype, target, source=None, options=None):
+    '''
+    Create and attach a new file system with the new mount API.
+    '''
+    if isinstance(options, str):
+        options = options.split(',')
+    attrs = 0
+    fs_fd = _check(libc.syscall(NR_fsopen, _encode(fstype), FSOPEN_CLOEXEC), 'fsopen', target)
+    try:
+        if source is not None:
+            _check(libc.syscall(NR_fsconfig, fs_fd, FSCONFIG_SET_STRING, b'source', _encode(source), 0),
+                   'fsconfig source', target)
+        for option in options or []:
+            if option in mount_attrs:
+                attrs |= mount_attrs[option]
+            elif option in ['defaults', 'rw', '']:
+                pass
+            elif '=' in option:
+                key, value = option.split('=', 1)
+                _check(libc.syscall(NR_fsconfig, fs_fd, FSCONFIG_SET_STRING, _encode(key), _encode(value), 0),
+                       f'fsconfig {option}', target)
+            else:
+                _check(libc.syscall(NR_fsconfig, fs_fd, FSCONFIG_SET_FLAG, _encode(option), None, 0),
+                       f'fsconfig {option}', target)
+        _check(libc.syscall(NR_fsconfig, fs_fd, FSCONFIG_CMD_CREATE, None, None, 0), 'fsconfig create', target)
+        mount_fd = _check(libc.syscall(NR_fsmount, fs_fd, FSMOUNT_CLOEXEC, attrs), 'fsmount', target)
+    finally:
+        os.close(fs_fd)
+    try:
+        _check(libc.syscall(NR_move_mount, mount_fd, b'', AT_FDCWD, _encode(target), MOVE_MOUNT_F_EMPTY_PATH),
+               'move_mount', target)
+    finally:
+        os.close(mount_fd)
+
+def mount(source, target, fstype, options=None, extra_flags=0):
+    '''
+    Plain mount(2) with comma-separated `options`.
+    '''
+    flags, data = parse_options(options)
+    _check(libc.mount(_encode(source), _encode(target), _encode(fstype), flags | extra_flags, _encode(data)),
+           'mount', target)
+
+def mount_fs(fstype, target, source=None, options=None):
+    '''
+    Mount file system of `fstype`, using the new mount API if possible.
+    '''
+    if has_new_api():
+        _fs_mount(fstype, target, source, options)
+    else:
+        mount(source or fstype, target, fstype, options)
+
+def mount_tmpfs(target, size='64K'):
+    mount_fs('tmpfs', target, 'tmpfs', [f'size={size}'])
+
+def mount_bind(source, target, recursive=False):
+    if has_new_api():
+        flags = OPEN_TREE_CLONE | OPEN_TREE_CLOEXEC | (AT_RECURSIVE if recursive else 0)
+        tree_fd = _check(libc.syscall(NR_open_tree, AT_FDCWD, _encode(source), flags), 'open_tree', source)
+        try:
+            _check(libc.syscall(NR_move_mount, tree_fd, b'', AT_FDCWD, _encode(target), MOVE_MOUNT_F_EMPTY_PATH),
+                   'move_mount', target)
+        finally:
+            os.close(tree_fd)
+    else:
+        mount(source, target, None, None, MS_BIND | (MS_REC if recursive else 0))
+
+def mount_overlay(lower, upper, work, target, options=('relatime',)):
+    mount_fs('overlay', target, 'overlay',
+             list(options) + [f'lowerdir={lower}', f'upperdir={upper}', f'workdir={work}'])
+
+def umount(target, flags=0):
+    _check(libc.umount2(_encode(target), flags), 'umount', target)
+
+def detect_fstype(device):
+    '''
+    Detect file system type by superblock magic.
+    Only ext2/3/4 is recognized, which is what pdt_create_volume makes;
+    return None for anything else.
+    '''
+    with open(device, 'rb') as f:
+        f.seek(1080)
+        if f.read(2) == b'\x53\xef':
+            return 'ext4'
+    return None
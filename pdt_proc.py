@@ -0,0 +1,217 @@
+'''
+Plausible Deniabity Toolkit
+
+Native /proc scanner: find and kill processes that hold files
+on given mount points or belong to given users.
+
+This is a local replacement for `lsof` and `ps` polling.
+All the work is done in one pass over /proc, processes are
+examined in parallel threads.
+
+Copyright 2018-2022 amateur80lvl
+License: BSD, see LICENSE for details.
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import pwd
+import select
+import signal
+import time
+
+def unescape(path):
+    '''
+    Decode octal escapes used in /proc/self/mountinfo, e.g. \\040 for space.
+    '''
+    if '\\' not in path:
+        return path
+    return path.encode().decode('unicode_escape').encode('latin-1').decode()
+
+def list_mount_points():
+    '''
+    Return the list of mount points from /proc/self/mountinfo.
+    '''
+    with open('/proc/self/mountinfo', 'r') as f:
+        return [unescape(line.split()[4]) for line in f]
+
+def mount_devices(mount_points):
+    '''
+    Return the set of device numbers of file systems mounted on
+    `mount_points` or anywhere beneath them.
+    '''
+    mount_points = [os.path.realpath(p).rstrip('/') or '/' for p in mount_points]
+    devices = set()
+    mounted = set()
+    with open('/proc/self/mountinfo', 'r') as f:
+        for line in f:
+            fields = line.split()
+            major, minor = fields[2].split(':')
+            mount_point = unescape(fields[4])
+            mounted.add(mount_point)
+            for directory in mount_points:
+                if mount_point == directory \
+                   or directory == '/' \
+                   or mount_point.startswith(directory + '/'):
+                    devices.add(os.makedev(int(major), int(minor)))
+                    break
+    # st_dev of some file systems (e.g. overlay) differs from mountinfo;
+    # stat only actual mount points, otherwise this would be the device
+    # of the parent file system
+    for directory in mount_points:
+        if directory in mounted:
+            try:
+                devices.add(os.stat(directory).st_dev)
+            except OSError:
+                pass
+    return devices
+
+def _stat_dev(path):
+    try:
+        return os.stat(path).st_dev
+    except OSError:
+        return None
+
+def _holds_device(pid, devices):
+    '''
+    Check if process `pid` has its cwd, root, executable, any open file
+    or memory mapping on one of `devices`.
+    '''
+    base = f'/proc/{pid}'
+    for name in ('cwd', 'root', 'exe'):
+        if _stat_dev(f'{base}/{name}') in devices:
+            return True
+    try:
+        fds = os.listdir(f'{base}/fd')
+    except OSError:
+        fds = []
+    for fd in fds:
+        if _stat_dev(f'{base}/fd/{fd}') in devices:
+            return True
+    try:
+        with open(f'{base}/maps', 'r') as f:
+            for line in f:
+                # address perms offset dev inode pathname
+                fields = line.split(None, 5)
+                if len(fields) < 6 or fields[4] == '0':
+                    continue
+                major, minor = fields[3].split(':')
+                if os.makedev(int(major, 16), int(minor, 16)) in devices:
+                    return True
+    except OSError:
+        pass
+    return False
+
+def _process_matches(pid, devices, uids):
+    if uids:
+        try:
+            if os.stat(f'/proc/{pid}').st_uid in uids:
+                return True
+        except OSError:
+            return False
+    if devices:
+        return _holds_device(pid, devices)
+    return False
+
+def _resolve_uids(users):
+    uids = set()
+    for user in users:
+        if isinstance(user, int):
+            uids.add(user)
+        else:
+            uids.add(pwd.getpwnam(user).pw_uid)
+    return uids
+
+def find_processes(mount_points=(), users=(), max_workers=None):
+    '''
+    Return the list of pids of processes that hold files under `mount_points`
+    (matched by device number) or are owned by `users` (names or uids).
+    The calling process is never included.
+    '''
+    devices = mount_devices(mount_points) if mount_points else set()
+    uids = _resolve_uids(users)
+    return _scan(devices, uids, max_workers)
+
+def _scan(devices, uids, max_workers=None):
+    if not devices and not uids:
+        return []
+    own_pid = os.getpid()
+    pids = [int(name) for name in os.listdir('/proc') if name.isdigit() and int(name) != own_pid]
+    if max_workers is None:
+        max_workers = min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        matches = executor.map(lambda pid: _process_matches(pid, devices, uids), pids)
+        return [pid for pid, matched in zip(pids, matches) if matched]
+
+def kill_processes(pids, verify=None, timeout=5):
+    '''
+    Send SIGKILL to `pids` and wait for them to exit.
+    Pidfds are used where available: if `verify` is given, it is called
+    with pid after the pidfd is obtained, so a recycled pid is not killed,
+    and waiting for termination does not require polling.
+    Return the number of processes signalled.
+    '''
+    pidfds = []
+    killed = 0
+    for pid in pids:
+        try:
+            pidfd = os.pidfd_open(pid)
+        except ProcessLookupError:
+            continue
+        except (AttributeError, OSError):
+            # no pidfd support
+            try:
+                os.kill(pid, signal.SIGKILL)
+                killed += 1
+            except ProcessLookupError:
+                pass
+            continue
+        if verify is not None and not verify(pid):
+            os.close(pidfd)
+            continue
+        try:
+            signal.pidfd_send_signal(pidfd, signal.SIGKILL)
+            killed += 1
+            pidfds.append(pidfd)
+        except ProcessLookupError:
+            os.close(pidfd)
+
+    # pidfd becomes readable when the process terminates
+    try:
+        poller = select.poll()
+        for pidfd in pidfds:
+            poller.register(pidfd, select.POLLIN)
+        remaining = len(pidfds)
+        deadline = time.monotonic() + timeout
+        while remaining:
+            wait_time = deadline - time.monotonic()
+            if wait_time <= 0:
+                break
+            for pidfd, _ in poller.poll(wait_time * 1000):
+                poller.unregister(pidfd)
+                remaining -= 1
+    finally:
+        for pidfd in pidfds:
+            os.close(pidfd)
+    return killed
+
+def kill_holders(mount_points=(), users=(), max_attempts=10):
+    '''
+    Kill all processes that hold files under `mount_points` or owned by `users`.
+    Re-scan after killing because new processes may have been spawned meanwhile.
+    Return the list of pids that survived the last attempt.
+    '''
+    devices = mount_devices(mount_points) if mount_points else set()
+    uids = _resolve_uids(users)
+    verify = lambda pid: _process_matches(pid, devices, uids)
+    pids = []
+    for attempt in range(max_attempts):
+        pids = _scan(devices, uids)
+        if not pids:
+            break
+        print(f'Killing {len(pids)} processes: {" ".join(str(pid) for pid in pids)}')
+        kill_processes(pids, verify)
+    else:
+        pids = _scan(devices, uids)
+        if pids:
+            print(f'Processes still alive after {max_attempts} attempts: {" ".join(str(pid) for pid in pids)}')
+    return pids
@@ -41,14 +41,19 @@ class MountRoot(Task):
     def setup(self):
         self.root_device = self.invoke.get_root_device()
         print(f'Mounting root partition {self.root_device} to /mnt/root')
-        self.invoke.run(f'mkdir -p /mnt/root')
-        self.invoke.run(f'mount {self.root_device} /mnt/root')
+        self.invoke.makedirs('/mnt/root')
+        self.invoke.mount_device(self.root_device, '/mnt/root')
 
     def teardown(self):
-        self.invoke.run('umount /mnt/root')
+        self.invoke.unmount('/mnt/root')
         print(f'Unmounted {self.root_device} from /mnt/root')
 
 
+def print_timings(message, timings):
+    for mount_point, seconds in timings:
+        print(f'{message} {mount_point} in {seconds * 1000:.1f} ms')
+
+
 def TmpfsMounts(*mount_points):
     '''
     Mount tmpfs to specific `mount_points`.
@@ -57,23 +62,17 @@ def TmpfsMounts(*mount_points):
 
         def setup(self):
             self.mounted_tmpfs = []
-            try:
-                for directory in mount_points:
-                    self.invoke.run(f'mkdir -p {directory}')
-                    self.invoke.run(f'mount -t tmpfs -o size=64K tmpfs {directory}')
-                    print(f'Mounted tmpfs on {directory}')
-                    self.mounted_tmpfs.append(directory)
-            except:
-                self.teardown()
-                raise
+            for directory in mount_points:
+                self.invoke.makedirs(directory)
+            timings = self.invoke.mount_batch(('tmpfs', directory) for directory in mount_points)
+            print_timings('Mounted tmpfs on', timings)
+            self.mounted_tmpfs = [directory for directory, _ in timings]
 
         def teardown(self):
-            for directory in self.mounted_tmpfs[::-1]:
-                try:
-                    self.invoke.run(f'umount {directory}')
-                    print(f'Unmounted tmpfs {directory}')
-                except:
-                    print(traceback.format_exc())
+            try:
+                self.invoke.unmount_many(*self.mounted_tmpfs)
+            except:
+                print(traceback.format_exc())
             self.mounted_tmpfs = []
 
     return TmpfsMounts
@@ -87,27 +86,22 @@ def BindMounts(*mount_spec):
 
         def setup(self):
             self.mounts = []
-            try:
-                for src, dest in mount_spec:
-                    if not self.invoke.path_exists(dest):
-                        if self.invoke.is_dir(src):
-                            self.invoke.run(f'mkdir -p {dest}')
-                        else:
-                            self.invoke.run(f'touch {dest}')
-                    self.invoke.run(f'mount --bind {src} {dest}')
-                    print(f'Bound {src} to {dest}')
-                    self.mounts.append(dest)
-            except:
-                self.teardown()
-                raise
+            for src, dest in mount_spec:
+                if not self.invoke.path_exists(dest):
+                    if self.invoke.is_dir(src):
+                        self.invoke.makedirs(dest)
+                    else:
+                        self.invoke.touch(dest)
+            timings = self.invoke.mount_batch(('bind', src, dest) for src, dest in mount_spec)
+            for (src, dest), (_, seconds) in zip(mount_spec, timings):
+                print(f'Bound {src} to {dest} in {seconds * 1000:.1f} ms')
+            self.mounts = [dest for dest, _ in timings]
 
         def teardown(self):
-            for directory in self.mounts[::-1]:
-                try:
-                    self.invoke.run(f'umount {directory}')
-                    print(f'Unbound {directory}')
-                except:
-                    print(traceback.format_exc())
+            try:
+                self.invoke.unmount_many(*self.mounts)
+            except:
+                print(traceback.format_exc())
             self.mounts = []
 
     return BindMounts
@@ -121,27 +115,19 @@ def OverlayMounts(*mount_spec):
 
         def setup(self):
             self.mounts = []
-            try:
-                for lower, upper, work, dest in mount_spec:
-                    if not self.invoke.path_exists(dest):
-                        if self.invoke.is_dir(src):
-                            self.invoke.run(f'mkdir -p {dest}')
-                        else:
-                            self.invoke.run(f'touch {dest}')
-                    self.invoke.run(f'mount -t overlay overlay -o relatime,lowerdir={lower},upperdir={upper},workdir={work} {dest}')
-                    print(f'Mounted {lower}+{upper} to {dest}')
-                    self.mounts.append(dest)
-            except:
-                self.teardown()
-                raise
+            for lower, upper, work, dest in mount_spec:
+                # overlay is always mounted on a directory
+                self.invoke.makedirs(dest)
+            timings = self.invoke.mount_batch(('overlay',) + tuple(spec) for spec in mount_spec)
+            for (lower, upper, work, dest), (_, seconds) in zip(mount_spec, timings):
+                print(f'Mounted {lower}+{upper} to {dest} in {seconds * 1000:.1f} ms')
+            self.mounts = [dest for dest, _ in timings]
 
         def teardown(self):
-            for directory in self.mounts[::-1]:
-                try:
-                    self.invoke.run(f'umount {directory}')
-                    print(f'Unbound {directory}')
-                except:
-                    print(traceback.format_exc())
+            try:
+                self.invoke.unmount_many(*self.mounts)
+            except:
+                print(traceback.format_exc())
             self.mounts = []
 
     return OverlayMounts
@@ -164,7 +150,7 @@ class MountVolumes(Task):
                     continue
 
                 if not self.invoke.path_exists(volume_config['mount_point']):
-                    self.invoke.run(f'mkdir {volume_config["mount_point"]}')
+                    self.invoke.makedirs(volume_config['mount_point'])
 
                 loop_device = self.invoke.get_encrypted_volume_device(volume_name)
                 if loop_device:
@@ -192,8 +178,11 @@ class MountVolumes(Task):
                     raise
 
                 print(f'Mounting {volume_device}')
-                mount_options = ','.join(set(['relatime'] + volume_config.get('mount_options', [])))
-                self.invoke.run(f'mount -o {mount_options} {volume_device} {volume_config["mount_point"]}')
+                mount_options = list(set(['relatime'] + volume_config.get('mount_options', [])))
+                timings = self.invoke.mount_batch([
+                    ('device', volume_device, volume_config['mount_point'], mount_options)
+                ])
+                print_timings('Mounted', timings)
                 self.mounted_volumes.append(volume_config['mount_point'])
         except:
             self.teardown()
@@ -201,8 +190,7 @@ class MountVolumes(Task):
 
     def teardown(self):
         # XXX exception  handling?
-        for mount_point in self.mounted_volumes:
-            self.invoke.run(f'umount {mount_point}')
+        self.invoke.unmount_many(*self.mounted_volumes)
         for loop_device, volume_name in self.opened_volumes:
             self.invoke.locrypt_close(volume_name, loop_device)
         self.mounted_volumes = []
@@ -3,29 +3,168 @@ Plausible Deniabity Toolkit
 
 Collect and compare sector hashes.
 
+Hash file format, all integers are little endian:
+
+    offset size
+       0     8  magic b'PDTSECHA'
+       8     2  format version
+      10     2  header size, digests start at this offset
+      12    16  algorithm name, NUL-padded ASCII
+      28     2  digest size
+      30     4  sector size
+      34     8  start LBA
+      42     8  end LBA, exclusive
+      50     8  device size in bytes
+      58     8  creation time, seconds since the epoch
+      66    64  device identity (serial number or WWID), NUL-padded
+     130     4  flags, bit 0: run-length encoded (version 2)
+     134     4  runs per index entry (version 2)
+     138     8  index offset (version 2)
+     146     8  number of runs (version 2)
+
+Version 1 files contain digests of sectors start LBA ... end LBA - 1
+right after the header.
+
+Version 2 files are run-length encoded: the header is followed by runs,
+each run is a digest followed by 4-byte sector count. The index at the end
+of file contains 8-byte starting LBAs of every N-th run and makes
+random access by LBA possible without reading all runs.
+
+Legacy files have no header and contain raw 8-byte blake2s digests
+starting from LBA 0.
+
+If hash file name is `-`, compute writes zlib-compressed hash file
+to stdout, with the final header appended as a trailer because
+the stream cannot be rewound (see receive_hashes), and find-intact
+reads zlib-compressed header and runs from stdin (see send_hashes).
+This is used by secha_remote.py to keep disk data on the remote host.
+
 Copyright 2018-2022 amateur80lvl
 License: BSD, see LICENSE for details.
 '''
 
-from hashlib import blake2s
+from bisect import bisect_right
+from hashlib import blake2b, blake2s
+from itertools import groupby, islice, repeat
+import os
+import stat
+import struct
 import sys
+import time
+import zlib
 
 digest_size = 8  # This is quite sufficient size IMAO. No collisions for 120GB SSD.
+default_algorithm = 'blake2s'
+
+MAGIC = b'PDTSECHA'
+FORMAT_VERSION = 2
+HEADER_SIZE = 256
+header_struct = struct.Struct('<8sHH16sHIQQQQ64sIIQQ')
+
+FLAG_RLE = 1
+run_count_struct = struct.Struct('<I')
+max_run_length = 0xFFFFFFFF
+index_interval = 1024
+
+sectors_per_read = 2048
+digests_per_read = 65536
+progress_interval = 1  # seconds
+
+def _blake2(hash_class):
+    def factory(size):
+        if not 1 <= size <= hash_class.MAX_DIGEST_SIZE:
+            raise Exception(f'Digest size for {hash_class.__name__} must be'
+                            f' between 1 and {hash_class.MAX_DIGEST_SIZE}')
+        return lambda data: hash_class(data, digest_size=size).digest()
+    return factory
+
+def _crc32(size):
+    if size != 4:
+        raise Exception('Digest size for crc32 must be 4')
+    return lambda data: zlib.crc32(data).to_bytes(4, 'little')
+
+def _xxhash(function_name):
+    def factory(size):
+        if size != 8:
+            raise Exception(f'Digest size for {function_name} must be 8')
+        try:
+            import xxhash
+        except ImportError:
+            raise Exception(f'{function_name} requires xxhash module')
+        return getattr(xxhash, f'{function_name}_digest')
+    return factory
+
+# name: (factory, default digest size)
+# crc32 and xxhash are fast but not cryptographic, use them
+# only when the hash file and the device can be trusted.
+algorithms = {
+    'blake2s': (_blake2(blake2s), 8),
+    'blake2b': (_blake2(blake2b), 8),
+    'crc32':   (_crc32, 4),
+    'xxh64':   (_xxhash('xxh64'), 8),
+    'xxh3_64': (_xxhash('xxh3_64'), 8),
+}
+
+def get_hash_function(algorithm, size):
+    '''
+    Return a function that computes digest of `size` bytes for sector data.
+    '''
+    if algorithm not in algorithms:
+        raise Exception(f'Unknown algorithm {algorithm}, available: {", ".join(algorithms)}')
+    factory, _ = algorithms[algorithm]
+    return factory(size)
+
+def parse_algorithm(spec):
+    '''
+    Parse algorithm specification in the form name[:digest-size].
+    '''
+    name, _, size = spec.partition(':')
+    if name not in algorithms:
+        raise Exception(f'Unknown algorithm {name}, available: {", ".join(algorithms)}')
+    return name, int(size) if size else algorithms[name][1]
+
+def parse_patterns(spec):
+    '''
+    Parse comma-separated hex patterns of constant sectors, e.g. ff,deadbeef.
+    All-zero sectors are always recognized.
+    '''
+    patterns = [b'\0']
+    for pattern in spec.split(','):
+        if pattern:
+            patterns.append(bytes.fromhex(pattern))
+    return patterns
 
 def parse_args():
-    if len(sys.argv) < 4:
-        print('Arguments: command device filename [start-lba end-lba] [sector-size] [min-length]]')
+    options = dict(
+        (arg[2:].split('=', 1) + [True])[:2] for arg in sys.argv[1:] if arg.startswith('--')
+    )
+    argv = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(argv) < 3:
+        print('Arguments: [--algorithm=name[:digest-size]] [--rle] [--patterns=hex,...] [--progress]'
+              ' command device filename [start-lba end-lba] [sector-size] [min-length]]')
+        print('Positional numbers can also be given as --start-lba=, --end-lba=, --sector-size=, --min-length=')
+        print('Commands: compute, find-intact, info')
+        print('Algorithms:', ', '.join(algorithms))
         sys.exit(1)
+    algorithm, size = parse_algorithm(options.get('algorithm', default_algorithm))
     args = {
-        'command': sys.argv[1],
-        'device_filename': sys.argv[2],
-        'hashes_filename': sys.argv[3],
+        'command': argv[0],
+        'device_filename': argv[1],
+        'hashes_filename': argv[2],
         'start_lba': None,
         'end_lba': None,
-        'sector_size': 512,
-        'min_length': 1
+        'sector_size': None,
+        'min_length': 1,
+        'algorithm': algorithm,
+        'digest_size': size,
+        'rle': bool(options.get('rle')),
+        'patterns': parse_patterns(options.get('patterns', '')),
+        'progress': bool(options.get('progress'))
     }
-    argv = sys.argv[4:]
+    for name in ['start-lba', 'end-lba', 'sector-size', 'min-length']:
+        if name in options:
+            args[name.replace('-', '_')] = int(options[name])
+    argv = argv[3:]
     if len(argv) >= 2:
         args['start_lba'] = int(argv.pop(0))
         args['end_lba'] = int(argv.pop(0))
@@ -40,54 +179,478 @@ def parse_args():
 
     return args
 
-def compute_hashes(device_filename, hashes_filename, sector_size):
-    with open(hashes_filename, 'wb') as f_hashes:
+def _read_sysfs(path):
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return ''
+
+def device_identity(device_filename):
+    '''
+    Return device size and identity string.
+    Identity is WWID or serial number for block devices, with partition
+    number appended for partitions, and empty string for regular files.
+    '''
+    with open(device_filename, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+    identity = ''
+    if stat.S_ISBLK(os.stat(device_filename).st_mode):
+        name = os.path.basename(os.path.realpath(device_filename))
+        sysfs_dir = f'/sys/class/block/{name}'
+        partition = _read_sysfs(f'{sysfs_dir}/partition')
+        if partition:
+            sysfs_dir = os.path.dirname(os.path.realpath(sysfs_dir))
+        for attr in ['wwid', 'device/wwid', 'serial', 'device/serial']:
+            identity = _read_sysfs(f'{sysfs_dir}/{attr}')
+            if identity:
+                break
+        if identity and partition:
+            identity = f'{identity}-part{partition}'
+    return size, identity
+
+def write_header(f, header):
+    flags = header.get('flags', 0)
+    data = header_struct.pack(
+        MAGIC,
+        2 if flags & FLAG_RLE else 1,
+        HEADER_SIZE,
+        header['algorithm'].encode('ascii'),
+        header['digest_size'],
+        header['sector_size'],
+        header['start_lba'],
+        header['end_lba'],
+        header['device_size'],
+        header['created'],
+        header['device_id'].encode('utf-8')[:64],
+        flags,
+        header.get('index_interval', 0),
+        header.get('index_offset', 0),
+        header.get('num_runs', 0)
+    )
+    f.write(data.ljust(HEADER_SIZE, b'\0'))
+
+def read_header(f):
+    '''
+    Read header from hash file and position `f` at the first digest.
+    For legacy files return header with `sector_size`, `end_lba`
+    and device identity unknown.
+    '''
+    data = f.read(header_struct.size)
+    header = parse_header(data)
+    f.seek(header['header_size'])
+    return header
+
+def parse_header(data):
+    if len(data) < header_struct.size or not data.startswith(MAGIC):
+        return {
+            'version': 0,
+            'header_size': 0,
+            'algorithm': 'blake2s',
+            'digest_size': digest_size,
+            'sector_size': None,
+            'start_lba': 0,
+            'end_lba': None,
+            'device_size': None,
+            'created': None,
+            'device_id': '',
+            'flags': 0
+        }
+    (magic, version, header_size, algorithm, size, sector_size, start_lba, end_lba,
+     device_size, created, device_id, flags, interval, index_offset, num_runs) = header_struct.unpack_from(data)
+    if version > FORMAT_VERSION:
+        raise Exception(f'Unsupported hash file version {version}')
+    return {
+        'version': version,
+        'header_size': header_size,
+        'algorithm': algorithm.rstrip(b'\0').decode('ascii'),
+        'digest_size': size,
+        'sector_size': sector_size,
+        'start_lba': start_lba,
+        'end_lba': end_lba,
+        'device_size': device_size,
+        'created': created,
+        'device_id': device_id.rstrip(b'\0').decode('utf-8'),
+        'flags': flags,
+        'index_interval': interval,
+        'index_offset': index_offset,
+        'num_runs': num_runs
+    }
+
+def check_header(header, device_filename, sector_size):
+    '''
+    Make sure the hash file was computed for this device and sector size.
+    Return effective sector size.
+    '''
+    if header['sector_size'] is None:
+        # legacy file
+        return sector_size or 512
+    if sector_size and sector_size != header['sector_size']:
+        raise Exception(f'Sector size {sector_size} does not match'
+                        f' hash file sector size {header["sector_size"]}')
+    if not header['device_size']:
+        # streamed legacy file
+        return header['sector_size']
+    device_size, device_id = device_identity(device_filename)
+    if device_size != header['device_size']:
+        raise Exception(f'Device size {device_size} does not match'
+                        f' hash file device size {header["device_size"]}')
+    if device_id and header['device_id'] and device_id != header['device_id']:
+        raise Exception(f'Device {device_id} does not match hash file device {header["device_id"]}')
+    return header['sector_size']
+
+class ZlibWriter:
+    '''
+    Write-only file-like object that compresses data to `f`.
+    '''
+    def __init__(self, f, level=1):
+        self.f = f
+        self.compressor = zlib.compressobj(level)
+        self.position = 0
+
+    def write(self, data):
+        self.f.write(self.compressor.compress(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        self.f.write(self.compressor.flush())
+        self.f.flush()
+
+
+class ZlibReader:
+    '''
+    Read-only file-like object that decompresses data from `f`.
+    '''
+    def __init__(self, f):
+        self.f = f
+        self.decompressor = zlib.decompressobj()
+        self.buffer = b''
+
+    def read(self, size):
+        while len(self.buffer) < size and not self.decompressor.eof:
+            data = self.f.read(65536)
+            if not data:
+                break
+            self.buffer += self.decompressor.decompress(data)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def with_progress(digests, total):
+    '''
+    Pass `digests` through, reporting the number of processed sectors
+    to stderr as `progress <done> <total>` lines.
+    '''
+    done = 0
+    next_report = time.monotonic() + progress_interval
+    for digest in digests:
+        yield digest
+        done += 1
+        if done & 4095 == 0 and time.monotonic() >= next_report:
+            print(f'progress {done} {total}', file=sys.stderr, flush=True)
+            next_report = time.monotonic() + progress_interval
+    print(f'progress {done} {total}', file=sys.stderr, flush=True)
+
+def pattern_sector(pattern, sector_size):
+    return (pattern * (sector_size // len(pattern) + 1))[:sector_size]
+
+def compute_digests(f_dev, sector_size, num_sectors, hash_function, patterns):
+    '''
+    Generate digests of sectors read from `f_dev`.
+    Sectors filled with one of `patterns` are recognized without hashing,
+    and whole chunks filled with a pattern are recognized by a single comparison.
+    '''
+    known_digests = {}
+    known_chunks = []
+    for pattern in patterns:
+        sector = pattern_sector(pattern, sector_size)
+        known_digests[sector] = hash_function(sector)
+        known_chunks.append((sector * sectors_per_read, known_digests[sector]))
+
+    while num_sectors is None or num_sectors > 0:
+        n = sectors_per_read if num_sectors is None else min(sectors_per_read, num_sectors)
+        data = f_dev.read(sector_size * n)
+        n = len(data) // sector_size
+        if n == 0:
+            break
+        for chunk, digest in known_chunks:
+            if n == sectors_per_read and data == chunk:
+                yield from repeat(digest, n)
+                break
+        else:
+            for i in range(0, n * sector_size, sector_size):
+                sector = data[i : i + sector_size]
+                digest = known_digests.get(sector)
+                yield digest if digest is not None else hash_function(sector)
+        if num_sectors is not None:
+            num_sectors -= n
+        if len(data) != sector_size * n:
+            break
+
+def write_runs(f_hashes, digests, header):
+    '''
+    Write run-length encoded `digests` followed by the index, update `header`.
+    '''
+    index = []
+    num_runs = 0
+    lba = header['start_lba']
+    for digest, group in groupby(digests):
+        count = sum(1 for _ in group)
+        while count:
+            run_length = min(count, max_run_length)
+            if num_runs % index_interval == 0:
+                index.append(lba)
+            _ = f_hashes.write(digest + run_count_struct.pack(run_length))
+            num_runs += 1
+            lba += run_length
+            count -= run_length
+    header['end_lba'] = lba
+    header['num_runs'] = num_runs
+    header['index_interval'] = index_interval
+    header['index_offset'] = f_hashes.tell()
+    _ = f_hashes.write(struct.pack(f'<{len(index)}Q', *index))
+
+def compute_hashes(device_filename, hashes_filename, sector_size, start_lba=None, end_lba=None,
+                   algorithm=default_algorithm, size=digest_size, rle=False, patterns=(b'\0',),
+                   progress=False):
+    sector_size = sector_size or 512
+    start_lba = start_lba or 0
+    hash_function = get_hash_function(algorithm, size)
+    device_size, device_id = device_identity(device_filename)
+    header = {
+        'algorithm': algorithm,
+        'digest_size': size,
+        'sector_size': sector_size,
+        'start_lba': start_lba,
+        'end_lba': start_lba,
+        'device_size': device_size,
+        'created': int(time.time()),
+        'device_id': device_id,
+        'flags': FLAG_RLE if rle else 0
+    }
+    num_sectors = (device_size // sector_size if end_lba is None else end_lba + 1) - start_lba
+
+    def write_hashes(f_hashes):
+        write_header(f_hashes, header)
         with open(device_filename, 'rb') as f_dev:
-            while True:
-                data = f_dev.read(sector_size)
-                if len(data) != sector_size:
-                    break
-                h = blake2s(data, digest_size=digest_size)
-                _ = f_hashes.write(h.digest())
-
-def find_intact_regions(device_filename, start_lba, end_lba, hashes_filename, sector_size, min_length):
-    lba = 0
+            f_dev.seek(start_lba * sector_size)
+            digests = compute_digests(f_dev, sector_size, num_sectors, hash_function, patterns)
+            if progress:
+                digests = with_progress(digests, num_sectors)
+            if rle:
+                write_runs(f_hashes, digests, header)
+            else:
+                for digest in digests:
+                    _ = f_hashes.write(digest)
+                    header['end_lba'] += 1
+
+    if hashes_filename == '-':
+        f_hashes = ZlibWriter(sys.stdout.buffer)
+        write_hashes(f_hashes)
+        write_header(f_hashes, header)
+        f_hashes.close()
+    else:
+        with open(hashes_filename, 'wb') as f_hashes:
+            write_hashes(f_hashes)
+            f_hashes.seek(0)
+            write_header(f_hashes, header)
+
+def receive_hashes(stream, hashes_filename):
+    '''
+    Write compressed hash file produced by `compute -` from `stream` to `hashes_filename`.
+    The trailing header replaces the preliminary one.
+    '''
+    reader = ZlibReader(stream)
+    with open(hashes_filename, 'wb') as f_hashes:
+        tail = b''
+        while True:
+            data = reader.read(1024 * 1024)
+            if not data:
+                break
+            data = tail + data
+            f_hashes.write(data[:-HEADER_SIZE])
+            tail = data[-HEADER_SIZE:]
+        if len(tail) != HEADER_SIZE or not tail.startswith(MAGIC):
+            raise Exception(f'Incomplete hash stream for {hashes_filename}')
+        f_hashes.seek(0)
+        f_hashes.write(tail)
+
+def read_runs(f_hashes, header, start_lba):
+    '''
+    Generate (digest, count) runs of run-length encoded hash file
+    starting from `start_lba`. The first run is trimmed accordingly.
+    '''
+    size = header['digest_size']
+    record_size = size + run_count_struct.size
+    num_runs = header['num_runs']
+    interval = header['index_interval']
+    num_entries = (num_runs + interval - 1) // interval
+    f_hashes.seek(header['index_offset'])
+    index = struct.unpack(f'<{num_entries}Q', f_hashes.read(num_entries * 8))
+
+    i = max(bisect_right(index, start_lba) - 1, 0)
+    run = i * interval
+    lba = index[i] if index else header['start_lba']
+    f_hashes.seek(header['header_size'] + run * record_size)
+    while run < num_runs:
+        n = min(digests_per_read, num_runs - run)
+        data = f_hashes.read(n * record_size)
+        for offset in range(0, len(data) - record_size + 1, record_size):
+            digest = data[offset : offset + size]
+            count = run_count_struct.unpack_from(data, offset + size)[0]
+            if lba + count > start_lba:
+                yield digest, lba + count - max(lba, start_lba)
+            lba += count
+        run += n
+
+def read_digests(f_hashes, header, start_lba):
+    '''
+    Generate digests of sectors starting from `start_lba`.
+    '''
+    if header['flags'] & FLAG_RLE:
+        for digest, count in read_runs(f_hashes, header, start_lba):
+            yield from repeat(digest, count)
+        return
+    size = header['digest_size']
+    f_hashes.seek(header['header_size'] + (start_lba - header['start_lba']) * size)
+    while True:
+        data = f_hashes.read(size * digests_per_read)
+        for offset in range(0, len(data) - size + 1, size):
+            yield data[offset : offset + size]
+        if len(data) != size * digests_per_read:
+            break
+
+def get_lba_range(header, start_lba, end_lba):
+    '''
+    Check requested LBA range is covered by hash file and return
+    effective start and end LBA, both inclusive. End LBA may be None
+    for legacy files, which means up to the end of device.
+    '''
+    if start_lba is None:
+        start_lba = header['start_lba']
+    if start_lba < header['start_lba']:
+        raise Exception(f'Start LBA {start_lba} is not covered by hash file,'
+                        f' which starts at {header["start_lba"]}')
+    if end_lba is not None and header['end_lba'] is not None and end_lba >= header['end_lba']:
+        raise Exception(f'End LBA {end_lba} is not covered by hash file,'
+                        f' which ends at {header["end_lba"] - 1}')
+    if end_lba is None and header['end_lba'] is not None:
+        end_lba = header['end_lba'] - 1
+    return start_lba, end_lba
+
+def find_intact_regions(device_filename, start_lba, end_lba, hashes_filename, sector_size, min_length,
+                        patterns=(b'\0',), progress=False):
+    if hashes_filename == '-':
+        f_hashes = ZlibReader(sys.stdin.buffer)
+        header = parse_header(f_hashes.read(HEADER_SIZE))
+        digests = read_stream_digests(f_hashes, header)
+        start_lba, end_lba = header['start_lba'], header['end_lba'] - 1
+        find_intact(device_filename, start_lba, end_lba, header, digests, sector_size,
+                    min_length, patterns, progress)
+        return
     with open(hashes_filename, 'rb') as f_hashes:
-        if start_lba:
-            f_hashes.seek(start_lba * digest_size)
-        with open(device_filename, 'rb') as f_dev:
-            if start_lba:
-                f_dev.seek(start_lba * sector_size)
-                lba = start_lba
-            intact_region_start = lba
-            intact_region_end = lba
-            while True:
-                if end_lba and lba > end_lba:
-                    break
-                data = f_dev.read(sector_size)
-                if len(data) != sector_size:
-                    break
-                h_orig = f_hashes.read(digest_size)
-                lba += 1
-                h = blake2s(data, digest_size=digest_size)
-                if h_orig == h.digest():
-                    intact_region_end += 1
-                else:
-                    region_length = intact_region_end - intact_region_start
-                    if region_length >= min_length:
-                        print('%s\t%s-%s' % (region_length, intact_region_start, intact_region_end))
-                    intact_region_start = lba
-                    intact_region_end = lba
-            region_length = intact_region_end - intact_region_start
-            if region_length >= min_length:
-                print('%s\t%s-%s' % (region_length, intact_region_start, intact_region_end))
+        header = read_header(f_hashes)
+        start_lba, end_lba = get_lba_range(header, start_lba, end_lba)
+        digests = read_digests(f_hashes, header, start_lba)
+        find_intact(device_filename, start_lba, end_lba, header, digests, sector_size,
+                    min_length, patterns, progress)
+
+def find_intact(device_filename, start_lba, end_lba, header, digests, sector_size, min_length,
+                patterns, progress):
+    sector_size = check_header(header, device_filename, sector_size)
+    hash_function = get_hash_function(header['algorithm'], header['digest_size'])
+    with open(device_filename, 'rb') as f_dev:
+        f_dev.seek(start_lba * sector_size)
+        lba = start_lba
+        intact_region_start = lba
+        intact_region_end = lba
+        num_sectors = None if end_lba is None else end_lba + 1 - start_lba
+        device_digests = compute_digests(f_dev, sector_size, num_sectors, hash_function, patterns)
+        if progress:
+            device_digests = with_progress(device_digests, num_sectors)
+        for h_orig, h in zip(digests, device_digests):
+            lba += 1
+            if h_orig == h:
+                intact_region_end += 1
+            else:
+                region_length = intact_region_end - intact_region_start
+                if region_length >= min_length:
+                    print('%s\t%s-%s' % (region_length, intact_region_start, intact_region_end))
+                intact_region_start = lba
+                intact_region_end = lba
+        region_length = intact_region_end - intact_region_start
+        if region_length >= min_length:
+            print('%s\t%s-%s' % (region_length, intact_region_start, intact_region_end))
+
+def read_stream_digests(f_hashes, header):
+    '''
+    Generate digests from runs read sequentially from a stream produced by send_hashes.
+    '''
+    size = header['digest_size']
+    record_size = size + run_count_struct.size
+    while True:
+        data = f_hashes.read(record_size * digests_per_read)
+        for offset in range(0, len(data) - record_size + 1, record_size):
+            count = run_count_struct.unpack_from(data, offset + size)[0]
+            yield from repeat(data[offset : offset + size], count)
+        if len(data) != record_size * digests_per_read:
+            break
+
+def send_hashes(hashes_filename, f_out, start_lba, end_lba, sector_size):
+    '''
+    Write hashes for the LBA range to `f_out` as compressed stream for `find-intact -`:
+    run-length encoded header without index, followed by runs.
+    Legacy files get sector size from arguments and no device identity.
+    '''
+    writer = ZlibWriter(f_out)
+    with open(hashes_filename, 'rb') as f_hashes:
+        header = read_header(f_hashes)
+        if header['version'] == 0:
+            header['sector_size'] = sector_size or 512
+            header['end_lba'] = f_hashes.seek(0, os.SEEK_END) // digest_size
+            header['device_size'] = 0
+            header['created'] = 0
+        start_lba, end_lba = get_lba_range(header, start_lba, end_lba)
+        digests = read_digests(f_hashes, header, start_lba)
+        stream_header = dict(header, start_lba=start_lba, end_lba=start_lba, flags=FLAG_RLE,
+                             index_interval=0, index_offset=0, num_runs=0)
+        stream_header['end_lba'] = end_lba + 1
+        write_header(writer, stream_header)
+        num_sectors = end_lba + 1 - start_lba
+        for digest, group in groupby(islice(digests, num_sectors)):
+            count = sum(1 for _ in group)
+            while count:
+                run_length = min(count, max_run_length)
+                writer.write(digest + run_count_struct.pack(run_length))
+                count -= run_length
+    writer.close()
+
+def print_info(hashes_filename):
+    with open(hashes_filename, 'rb') as f_hashes:
+        header = read_header(f_hashes)
+    if header['version'] == 0:
+        print('Legacy hash file: blake2s, digest size 8, no header')
+        return
+    for k, v in header.items():
+        if k == 'created':
+            v = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(v))
+        print(f'{k}: {v}')
 
 if __name__ == '__main__':
     args = parse_args()
     if args['command'] == 'compute':
-        compute_hashes(args['device_filename'], args['hashes_filename'], args['sector_size'])
+        compute_hashes(args['device_filename'], args['hashes_filename'], args['sector_size'],
+                       args['start_lba'], args['end_lba'], args['algorithm'], args['digest_size'],
+                       args['rle'], args['patterns'], args['progress'])
     elif args['command'] == 'find-intact':
         find_intact_regions(args['device_filename'], args['start_lba'], args['end_lba'],
-                            args['hashes_filename'], args['sector_size'], args['min_length'])
+                            args['hashes_filename'], args['sector_size'], args['min_length'],
+                            args['patterns'], args['progress'])
+    elif args['command'] == 'info':
+        print_info(args['hashes_filename'])
     else:
         print('bad command:', args['command'])
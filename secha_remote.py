@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+'''
+Plausible Deniabity Toolkit
+
+Run secha.py on remote hosts via Invoke, so disk data never crosses the network.
+
+secha.py is sent to the remote host as a part of command line and runs there
+with `-` instead of hash file name. For `compute`, the compressed hash file
+streams back and is saved locally. For `find-intact`, hashes for the requested
+range are streamed to the remote host and only the list of intact regions
+comes back. Jobs run concurrently, progress is aggregated locally.
+
+Example:
+
+    secha_remote.py [options] command [host]:device:hashes-file ...
+
+Where `command` is `compute` or `find-intact`, and empty host means local.
+Options are those of secha.py given in the form --name=value, plus --ssh-key.
+
+Copyright 2018-2022 amateur80lvl
+License: BSD, see LICENSE for details.
+'''
+
+import base64
+import subprocess
+import sys
+import threading
+import zlib
+
+from pdt_base import Invoke
+import secha
+
+class Job:
+    '''
+    Single secha run for a device on a host.
+    '''
+    def __init__(self, invoke, device_filename, hashes_filename):
+        self.invoke = invoke
+        self.device_filename = device_filename
+        self.hashes_filename = hashes_filename
+        self.name = f'{invoke.remote or "localhost"}:{device_filename}'
+        self.done = 0
+        self.total = None
+        self.regions = []
+        self.errors = []
+        self.returncode = None
+
+    @property
+    def failed(self):
+        return self.returncode != 0 or bool(self.errors)
+
+
+def secha_command(args):
+    '''
+    Return arguments to run secha.py with `args` by a python interpreter
+    which does not have secha.py.
+    '''
+    with open(secha.__file__, 'rb') as f:
+        source = base64.b64encode(zlib.compress(f.read(), 9)).decode('ascii')
+    code = f"import base64,zlib;exec(zlib.decompress(base64.b64decode('{source}')))"
+    return ['python3', '-c', code, '--progress'] + args
+
+def _start(job, command, options, stdin):
+    return job.invoke.popen(
+        secha_command(options + [command, job.device_filename, '-']),
+        title=f'secha {command} {job.device_filename}',
+        stdin=stdin,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+
+def _read_stderr(job, stream):
+    for line in stream:
+        line = line.decode('utf-8', 'replace').rstrip()
+        fields = line.split()
+        if len(fields) == 3 and fields[0] == 'progress':
+            job.done = int(fields[1])
+            job.total = int(fields[2]) if fields[2] != 'None' else None
+        elif line:
+            job.errors.append(line)
+
+def _finish(job, proc, stderr_thread):
+    proc.wait()
+    stderr_thread.join()
+    job.returncode = proc.returncode
+
+def run_compute(job, options):
+    proc = _start(job, 'compute', options, subprocess.DEVNULL)
+    stderr_thread = threading.Thread(target=_read_stderr, args=(job, proc.stderr))
+    stderr_thread.start()
+    try:
+        secha.receive_hashes(proc.stdout, job.hashes_filename)
+    except Exception as e:
+        job.errors.append(str(e))
+    _finish(job, proc, stderr_thread)
+
+def run_find_intact(job, options, start_lba=None, end_lba=None, sector_size=None):
+    proc = _start(job, 'find-intact', options, subprocess.PIPE)
+    stderr_thread = threading.Thread(target=_read_stderr, args=(job, proc.stderr))
+    stderr_thread.start()
+
+    def send():
+        try:
+            secha.send_hashes(job.hashes_filename, proc.stdin, start_lba, end_lba, sector_size)
+        except BrokenPipeError:
+            # remote side has failed, the error is in its stderr
+            pass
+        except Exception as e:
+            job.errors.append(str(e))
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    sender_thread = threading.Thread(target=send)
+    sender_thread.start()
+    for line in proc.stdout:
+        job.regions.append(line.decode('utf-8').rstrip())
+    sender_thread.join()
+    _finish(job, proc, stderr_thread)
+
+def print_progress(jobs):
+    done = sum(job.done for job in jobs)
+    total = sum(job.total or 0 for job in jobs)
+    parts = [f'{job.name} {job.done * 100 // job.total}%' for job in jobs if job.total]
+    if total:
+        print(f'\r{done * 100 // total}% [{", ".join(parts)}]', end='', file=sys.stderr, flush=True)
+
+def run_jobs(jobs, target, *args):
+    '''
+    Run `target` for each job in a separate thread, print aggregated progress.
+    '''
+    threads = [threading.Thread(target=target, args=(job,) + args) for job in jobs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(secha.progress_interval)
+            print_progress(jobs)
+    print(file=sys.stderr)
+
+def parse_args():
+    options = [arg for arg in sys.argv[1:] if arg.startswith('--')]
+    argv = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(argv) < 2 or argv[0] not in ['compute', 'find-intact']:
+        print('Arguments: [options] compute|find-intact [host]:device:hashes-file ...')
+        sys.exit(1)
+    ssh_key = None
+    local_options = {}
+    secha_options = []
+    for option in options:
+        name, _, value = option[2:].partition('=')
+        if name == 'ssh-key':
+            ssh_key = value
+        elif argv[0] == 'find-intact' and name in ['start-lba', 'end-lba', 'sector-size']:
+            # applied locally by send_hashes
+            local_options[name.replace('-', '_')] = int(value)
+        else:
+            secha_options.append(option)
+    jobs = []
+    for spec in argv[1:]:
+        host, device_filename, hashes_filename = spec.split(':', 2)
+        jobs.append(Job(Invoke(remote=host or None, ssh_key=ssh_key), device_filename, hashes_filename))
+    return argv[0], jobs, secha_options, local_options
+
+if __name__ == '__main__':
+    command, jobs, secha_options, local_options = parse_args()
+    if command == 'compute':
+        run_jobs(jobs, run_compute, secha_options)
+    else:
+        run_jobs(jobs, run_find_intact, secha_options,
+                 local_options.get('start_lba'), local_options.get('end_lba'), local_options.get('sector_size'))
+    for job in jobs:
+        for region in job.regions:
+            print(f'{job.name}\t{region}')
+    failed = [job for job in jobs if job.failed]
+    for job in failed:
+        print(f'{job.name} failed:', *job.errors, sep='\n  ', file=sys.stderr)
+    if failed:
+        sys.exit(1)